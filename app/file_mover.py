@@ -1,18 +1,51 @@
 """
-Module to move processed videos and shots to SMB share using smbclient.
+Module to move processed videos and shots to SMB share using smbprotocol.
 """
 
+import asyncio
+import io
 import os
+import re
 import shutil
-import subprocess
 import logging
+import tarfile
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from smbprotocol.connection import Connection
+from smbprotocol.session import Session
+from smbprotocol.tree import TreeConnect
+from smbprotocol.open import (
+    Open,
+    CreateDisposition,
+    CreateOptions,
+    DirectoryAccessMask,
+    FilePipePrinterAccessMask,
+    ImpersonationLevel,
+    ShareAccess,
+)
+from smbprotocol.file_info import FileAttributes
+
 log = logging.getLogger('file_mover')
 
+# Characters not valid in filenames, all mapped to '_'
+_INVALID_CHARS = str.maketrans({c: '_' for c in '<>:"/\\|?*'})
+_MULTI_UNDERSCORE = re.compile(r'_{2,}')
+
+# Size of each SMB2 WRITE request when uploading a file
+_CHUNK_SIZE = 1024 * 1024
+# Shots archives larger than this are spooled to a temporary file instead of memory
+_ARCHIVE_SPOOL_SIZE = 64 * 1024 * 1024
+# Account used when SMB_USERNAME is empty; the server must allow guest access
+_GUEST_USERNAME = 'Guest'
+
 
 class FileMover:
-    """Handles moving processed videos to SMB network share via smbclient."""
+    """Handles moving processed videos to SMB network share over a persistent SMB connection."""
 
     def __init__(self, config):
         self.enabled = getattr(config, 'SMB_ENABLED', False)
@@ -22,6 +55,20 @@ class FileMover:
         self.username = getattr(config, 'SMB_USERNAME', '')
         self.password = getattr(config, 'SMB_PASSWORD', '')
         self.domain = getattr(config, 'SMB_DOMAIN', '')
+        self.max_connections = int(getattr(config, 'SMB_MAX_CONNECTIONS', 4))
+        self.shots_archive = getattr(config, 'SMB_SHOTS_ARCHIVE', False)
+        # Seconds a move may go without any SMB request completing before it is aborted
+        self.timeout = float(getattr(config, 'SMB_TIMEOUT', 120))
+
+        # Moves run on their own thread so long uploads don't hold the default executor
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='smb')
+
+        # Connection, session and tree are created on first use and kept open across moves
+        self._lock = threading.Lock()
+        self._connection = None
+        self._tree = None
+        # monotonic() of the last completed SMB request, watched by move_to_smb_async
+        self._last_activity = time.monotonic()
 
     def is_enabled(self) -> bool:
         """Check if SMB moving is enabled and configured."""
@@ -29,75 +76,217 @@ class FileMover:
                 bool(self.server) and
                 bool(self.share))
 
-    def _get_auth_args(self) -> list:
-        """Build authentication arguments for smbclient."""
-        # If no username provided, use anonymous/guest access
-        if not self.username:
-            return ['-N']  # -N = no password (anonymous)
+    def _is_guest(self) -> bool:
+        """True when no username is configured and the share is accessed as guest."""
+        return not self.username
 
-        # Build auth string: DOMAIN/user%password or user%password
+    def _get_username(self) -> str:
+        """Build the SMB username, falling back to the guest account."""
+        if self._is_guest():
+            return _GUEST_USERNAME
         if self.domain:
-            auth = f"{self.domain}/{self.username}%{self.password}"
-        else:
-            auth = f"{self.username}%{self.password}"
+            return f"{self.domain}\\{self.username}"
+        return self.username
+
+    def _get_tree(self) -> TreeConnect:
+        """Return the connected share, opening the SMB connection if needed."""
+        with self._lock:
+            if self._tree is None:
+                log.info(f"[SMB] Connecting to //{self.server}/{self.share}")
+                guest = self._is_guest()
+                # Guest sessions have no session key, so they can't be signed
+                connection = Connection(uuid.uuid4(), self.server, 445,
+                                        require_signing=not guest)
+                connection.connect()
+                # Published before the session setup so a stalled login can be aborted
+                self._connection = connection
+                try:
+                    password = '' if guest else (self.password or None)
+                    session = Session(connection, self._get_username(), password,
+                                      require_encryption=False)
+                    session.connect()
+                    tree = TreeConnect(session, f"\\\\{self.server}\\{self.share}")
+                    tree.connect()
+                except Exception:
+                    self._connection = None
+                    connection.disconnect()
+                    raise
+                self._tree = tree
+            return self._tree
+
+    def _disconnect(self):
+        """Drop the cached SMB connection so the next move reconnects."""
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.disconnect()
+                except Exception as e:
+                    log.debug(f"[SMB] Error closing connection: {e}")
+            self._connection = None
+            self._tree = None
+
+    def _abort(self):
+        """
+        Close the SMB socket without logging off.
+
+        smbprotocol waits for responses without a timeout, so this is the only
+        way to wake a thread blocked on a stalled server. The move then fails and
+        drops the connection itself.
+        """
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.disconnect(close=False)
+            except Exception as e:
+                log.debug(f"[SMB] Error aborting connection: {e}")
+
+    def _touch(self):
+        """Record that an SMB request has just completed."""
+        self._last_activity = time.monotonic()
 
-        return ['-U', auth]
+    def close(self):
+        """Stop accepting moves; a move already running is left to finish."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
     def _sanitize_filename(self, name: str) -> str:
         """Remove/replace characters not valid in filenames."""
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            name = name.replace(char, '_')
+        name = name.translate(_INVALID_CHARS)
         # Replace multiple underscores with single
-        while '__' in name:
-            name = name.replace('__', '_')
-        return name.strip('_')[:200]
+        return _MULTI_UNDERSCORE.sub('_', name).strip('_')[:200]
+
+    def _mkdir(self, remote_path: str):
+        """Create a remote directory and its parents; existing directories are kept."""
+        tree = self._get_tree()
+        parts = [p for p in remote_path.split('\\') if p]
+        for i in range(1, len(parts) + 1):
+            directory = Open(tree, '\\'.join(parts[:i]))
+            directory.create(
+                ImpersonationLevel.Impersonation,
+                DirectoryAccessMask.FILE_LIST_DIRECTORY | DirectoryAccessMask.FILE_ADD_SUBDIRECTORY,
+                FileAttributes.FILE_ATTRIBUTE_DIRECTORY,
+                ShareAccess.FILE_SHARE_READ | ShareAccess.FILE_SHARE_WRITE,
+                CreateDisposition.FILE_OPEN_IF,
+                CreateOptions.FILE_DIRECTORY_FILE
+            )
+            directory.close()
+            self._touch()
+
+    def _put_fileobj(self, fileobj, remote_path: str):
+        """
+        Upload the contents of a binary file object, overwriting any existing file.
+
+        Args:
+            fileobj: Readable binary file object, read from its current position
+            remote_path: Destination path relative to the share root
+        """
+        tree = self._get_tree()
+        chunk_size = min(_CHUNK_SIZE, tree.session.connection.max_write_size)
+
+        remote_file = Open(tree, remote_path)
+        remote_file.create(
+            ImpersonationLevel.Impersonation,
+            FilePipePrinterAccessMask.GENERIC_WRITE,
+            FileAttributes.FILE_ATTRIBUTE_NORMAL,
+            ShareAccess.FILE_SHARE_READ,
+            CreateDisposition.FILE_OVERWRITE_IF,
+            CreateOptions.FILE_NON_DIRECTORY_FILE
+        )
+        self._touch()
+        try:
+            offset = 0
+            while chunk := fileobj.read(chunk_size):
+                remote_file.write(chunk, offset)
+                offset += len(chunk)
+                self._touch()
+        finally:
+            remote_file.close()
+
+    def _put_file(self, local_path: Path, remote_path: str):
+        """
+        Upload a local file to the share, overwriting any existing file.
 
-    def _run_smbclient(self, commands: list) -> tuple[bool, str]:
+        Args:
+            local_path: Local file to upload
+            remote_path: Destination path relative to the share root
         """
-        Execute smbclient commands.
+        with open(local_path, 'rb') as f:
+            self._put_fileobj(f, remote_path)
+
+    def _put_shot(self, source, remote_path: str):
+        """Upload a shot given either as encoded bytes or as a local file path."""
+        if isinstance(source, bytes):
+            self._put_fileobj(io.BytesIO(source), remote_path)
+        else:
+            self._put_file(source, remote_path)
+
+    def _upload_shots_archive(self, remote_path: str, shots: dict) -> tuple[bool, str]:
+        """
+        Upload all shots packed into a single uncompressed tar archive.
+
+        One large sequential write replaces a CREATE/WRITE/CLOSE round-trip
+        per JPEG.
 
         Args:
-            commands: List of smbclient commands to execute
+            remote_path: Destination path of the archive, relative to the share root
+            shots: {filename: encoded bytes or local Path} of the shots to pack
 
         Returns:
             Tuple of (success: bool, message: str)
         """
-        share_path = f"//{self.server}/{self.share}"
-        cmd_string = "; ".join(commands)
+        try:
+            with tempfile.SpooledTemporaryFile(max_size=_ARCHIVE_SPOOL_SIZE) as spool:
+                with tarfile.open(fileobj=spool, mode='w') as tar:
+                    for name, source in shots.items():
+                        if isinstance(source, bytes):
+                            member = tarfile.TarInfo(name)
+                            member.size = len(source)
+                            member.mtime = int(time.time())
+                            tar.addfile(member, io.BytesIO(source))
+                        else:
+                            tar.add(source, arcname=name)
+                spool.seek(0)
+                self._put_fileobj(spool, remote_path)
+        except Exception as e:
+            return False, str(e)
 
-        cmd = [
-            'smbclient',
-            share_path,
-            self._get_auth_args(),
-            '-c', cmd_string
-        ]
+        log.info(f"[SMB] Uploaded {len(shots)} shot files as {remote_path}")
+        return True, ''
 
-        log.debug(f"[SMB] Executing: smbclient {share_path} -U *** -c \"{cmd_string}\"")
+    def _upload_shots(self, remote_shots: str, shots: dict) -> tuple[bool, str]:
+        """
+        Upload shots concurrently over the shared SMB connection.
 
-        try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
+        Each upload uses its own file handle, so SMB2 requests for many small
+        JPEGs are in flight at the same time instead of one after another.
 
-            if result.returncode != 0:
-                log.error(f"[SMB] smbclient failed: {result.stderr}")
-                return False, result.stderr
+        Args:
+            remote_shots: Remote shots directory, relative to the share root
+            shots: {filename: encoded bytes or local Path} of the shots to upload
 
-            log.debug(f"[SMB] smbclient output: {result.stdout}")
-            return True, result.stdout
+        Returns:
+            Tuple of (success: bool, message: str)
+        """
+        workers = max(1, min(self.max_connections, len(shots)))
 
-        except subprocess.TimeoutExpired:
-            log.error("[SMB] smbclient timed out")
-            return False, "Operation timed out"
-        except Exception as e:
-            log.error(f"[SMB] smbclient error: {e}")
-            return False, str(e)
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self._put_shot, source, f"{remote_shots}\\{name}"): name
+                for name, source in shots.items()
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(f"{futures[future]}: {e}")
+
+        if errors:
+            return False, '\n'.join(errors)
 
-    def move_to_smb(self, video_path: str, shots_dir: str, video_title: str) -> dict:
+        log.info(f"[SMB] Uploaded {len(shots)} shot files")
+        return True, ''
+
+    def move_to_smb(self, video_path: str, shots_dir: str, video_title: str, shots: dict = None) -> dict:
         """
         Copy video and shots folder to SMB share, then delete local files.
 
@@ -105,6 +294,8 @@ class FileMover:
             video_path: Full path to the original video file
             shots_dir: Full path to the shots directory
             video_title: Title for organizing in destination
+            shots: Optional {filename: JPEG bytes} uploaded straight from memory
+                instead of the *.jpg files in shots_dir
 
         Returns:
             dict with status and details
@@ -124,84 +315,47 @@ class FileMover:
             # Build base path in SMB share
             base_path = self.path.strip('/') if self.path else ''
             remote_dir = f"{base_path}/{safe_title}" if base_path else safe_title
+            remote_dir_smb = remote_dir.replace('/', '\\')
 
             # Step 1: Create directory structure
-            commands = []
-            if base_path:
-                commands.append(f'cd "{base_path}"')
-            commands.append(f'mkdir "{safe_title}"')
-            commands.append(f'cd "{safe_title}"')
-
-            success, msg = self._run_smbclient(commands)
-            if not success and 'NT_STATUS_OBJECT_NAME_COLLISION' not in msg:
-                # Directory might already exist, which is OK
-                log.warning(f"[SMB] Directory creation warning: {msg}")
+            self._mkdir(remote_dir_smb)
 
             # Step 2: Upload video file
             files_to_delete = []
 
             if video_path.exists():
-                commands = []
-                if base_path:
-                    commands.append(f'cd "{base_path}"')
-                commands.append(f'cd "{safe_title}"')
-                commands.append(f'lcd "{video_path.parent}"')
-                commands.append(f'put "{video_path.name}"')
-
-                success, msg = self._run_smbclient(commands)
-                if success:
-                    log.info(f"[SMB] Video uploaded: {video_path.name}")
-                    files_to_delete.append(video_path)
-                else:
-                    return {'status': 'error', 'msg': f'Failed to upload video: {msg}'}
+                try:
+                    self._put_file(video_path, f"{remote_dir_smb}\\{video_path.name}")
+                except Exception as e:
+                    self._disconnect()
+                    return {'status': 'error', 'msg': f'Failed to upload video: {e}'}
+                log.info(f"[SMB] Video uploaded: {video_path.name}")
+                files_to_delete.append(video_path)
 
                 # Also upload FHD scaled version if exists
                 fhd_path = video_path.parent / f"{video_path.stem}_FHD{video_path.suffix}"
                 if fhd_path.exists():
-                    commands = []
-                    if base_path:
-                        commands.append(f'cd "{base_path}"')
-                    commands.append(f'cd "{safe_title}"')
-                    commands.append(f'lcd "{fhd_path.parent}"')
-                    commands.append(f'put "{fhd_path.name}"')
-
-                    success, msg = self._run_smbclient(commands)
-                    if success:
+                    try:
+                        self._put_file(fhd_path, f"{remote_dir_smb}\\{fhd_path.name}")
                         log.info(f"[SMB] FHD video uploaded: {fhd_path.name}")
                         files_to_delete.append(fhd_path)
-                    else:
-                        log.warning(f"[SMB] Failed to upload FHD video: {msg}")
+                    except Exception as e:
+                        log.warning(f"[SMB] Failed to upload FHD video: {e}")
 
             # Step 3: Upload shots folder
-            if shots_path.exists() and shots_path.is_dir():
-                shot_files = list(shots_path.glob('*.jpg'))
-
-                if shot_files:
-                    # Create shots directory and upload files
-                    commands = []
-                    if base_path:
-                        commands.append(f'cd "{base_path}"')
-                    commands.append(f'cd "{safe_title}"')
-                    commands.append('mkdir shots')
-
-                    success, msg = self._run_smbclient(commands)
-                    # Ignore if already exists
-
-                    # Upload all shot files
-                    commands = []
-                    if base_path:
-                        commands.append(f'cd "{base_path}"')
-                    commands.append(f'cd "{safe_title}"')
-                    commands.append('cd shots')
-                    commands.append(f'lcd "{shots_path}"')
-                    commands.append('prompt off')
-                    commands.append('mput *.jpg')
-
-                    success, msg = self._run_smbclient(commands)
-                    if success:
-                        log.info(f"[SMB] Uploaded {len(shot_files)} shot files")
-                    else:
-                        return {'status': 'error', 'msg': f'Failed to upload shots: {msg}'}
+            if shots is None and shots_path.exists() and shots_path.is_dir():
+                shots = {f.name: f for f in sorted(shots_path.glob('*.jpg'))}
+
+            if shots:
+                if self.shots_archive:
+                    success, msg = self._upload_shots_archive(f"{remote_dir_smb}\\shots.tar", shots)
+                else:
+                    remote_shots = f"{remote_dir_smb}\\shots"
+                    self._mkdir(remote_shots)
+                    success, msg = self._upload_shots(remote_shots, shots)
+                if not success:
+                    self._disconnect()
+                    return {'status': 'error', 'msg': f'Failed to upload shots: {msg}'}
 
             # Step 4: Delete local files after successful upload
             for file_path in files_to_delete:
@@ -226,4 +380,32 @@ class FileMover:
 
         except Exception as e:
             log.error(f"[SMB] Failed to move files: {e}", exc_info=True)
+            # The connection may be broken; reconnect on the next move
+            self._disconnect()
             return {'status': 'error', 'msg': str(e)}
+
+    async def move_to_smb_async(self, video_path: str, shots_dir: str, video_title: str,
+                                shots: dict = None) -> dict:
+        """
+        Awaitable version of move_to_smb for use from the asyncio event loop.
+
+        Moves are serialized on a dedicated thread; see move_to_smb for arguments.
+        If no SMB request completes for self.timeout seconds the connection is
+        aborted, which unblocks the thread, and an error is returned.
+        """
+        loop = asyncio.get_running_loop()
+        self._touch()
+        future = loop.run_in_executor(
+            self._executor, self.move_to_smb, video_path, shots_dir, video_title, shots
+        )
+        while True:
+            idle = time.monotonic() - self._last_activity
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout - idle)
+            except asyncio.TimeoutError:
+                if time.monotonic() - self._last_activity >= self.timeout:
+                    break
+
+        log.error(f"[SMB] No response from //{self.server}/{self.share} in {self.timeout:g}s, aborting move")
+        self._abort()
+        return {'status': 'error', 'msg': f'SMB server stalled for {self.timeout:g}s'}
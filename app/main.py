@@ -76,13 +76,19 @@ class Config:
         # === Detección de Vehículos ===
         'ENABLE_VEHICLE_DETECTION': 'True',
         'SHOTS_DIR': './shots',
+        'SCALE_SAVE_FHD': 'false',
+        'SCALE_PRESET': 'veryfast',
+        'COMPLETED_MAX': '500',
         'YOLO_MODEL': 'yolo11n.pt',
         'YOLO_CONF_THRESHOLD': '0.5',
         'YOLO_SIMILARITY_THRESHOLD': '0.80',
         'YOLO_MIN_AREA': '40000',
         'YOLO_STRATEGY': 'complete',
+        'YOLO_BATCH_SIZE': '8',
+        'YOLO_HALF': 'true',
         'PLATE_DETECTOR_MODEL': 'yolo-v9-s-608-license-plate-end2end',
         'PLATE_OCR_MODEL': 'global-plates-mobile-vit-v2-model',
+        'PLATE_PRECISION': 'fp32',
         # === SMB/Samba Configuration ===
         'SMB_ENABLED': 'false',
         'SMB_SERVER': '',
@@ -91,9 +97,12 @@ class Config:
         'SMB_USERNAME': '',
         'SMB_PASSWORD': '',
         'SMB_DOMAIN': '',
+        'SMB_MAX_CONNECTIONS': '4',
+        'SMB_SHOTS_ARCHIVE': 'false',
+        'SMB_TIMEOUT': '120',
     }
 
-    _BOOLEAN = ('DOWNLOAD_DIRS_INDEXABLE', 'CUSTOM_DIRS', 'CREATE_CUSTOM_DIRS', 'DELETE_FILE_ON_TRASHCAN', 'HTTPS', 'ENABLE_ACCESSLOG', 'ENABLE_VEHICLE_DETECTION', 'SMB_ENABLED')
+    _BOOLEAN = ('DOWNLOAD_DIRS_INDEXABLE', 'CUSTOM_DIRS', 'CREATE_CUSTOM_DIRS', 'DELETE_FILE_ON_TRASHCAN', 'HTTPS', 'ENABLE_ACCESSLOG', 'ENABLE_VEHICLE_DETECTION', 'SCALE_SAVE_FHD', 'YOLO_HALF', 'SMB_ENABLED', 'SMB_SHOTS_ARCHIVE')
 
     def __init__(self):
         for k, v in self._DEFAULTS.items():
@@ -217,6 +226,7 @@ class Notifier(DownloadQueueNotifier, ProcessingQueueNotifier):
 notifier = Notifier()
 dqueue = DownloadQueue(config, notifier)
 app.on_startup.append(lambda app: dqueue.initialize())
+app.on_shutdown.append(lambda app: dqueue.video_processor.close())
 
 class FileOpsFilter(DefaultFilter):
     def __call__(self, change_type: int, path: str) -> bool:
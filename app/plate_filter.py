@@ -6,23 +6,175 @@ Requiere: pip install fast-alpr opencv-python
 """
 
 import cv2
+import os
 import re
 import argparse
 import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import onnxruntime as ort
 from fast_alpr import ALPR
+from fast_alpr.base import BaseDetector
+from open_image_models import create_detector
+from open_image_models.detection.core.hub import download_model as download_detector
+from fast_plate_ocr.inference.hub import download_model as download_ocr
+
+# Imágenes por lote para el detector de placas
+BATCH_SIZE = 16
+
+VEHICLE_TYPES = ["motorcycle", "car", "bus", "truck"]
+
+# Placas más pequeñas que esto (px) no se pasan al OCR: no serían legibles
+MIN_PLATE_WIDTH = 20
+MIN_PLATE_HEIGHT = 10
+# Máximo de candidatas (por confianza) sobre las que se ejecuta OCR
+MAX_PLATE_CANDIDATES = 3
+
+
+# Formatos de placa por tipo de vehículo, compilados una sola vez
+_RE_MOTO = re.compile(r'[A-Z]{3}[0-9]{2}[A-Z]')
+_RE_CAR = re.compile(r'[A-Z]{3}[0-9]{3}')
+_VALIDATORS = {
+    "motorcycle": _RE_MOTO,
+    "car": _RE_CAR,
+    "bus": _RE_CAR,
+    "truck": _RE_CAR,
+}
 
 
 def is_valid_plate(text: str, vehicle_type: str = None) -> bool:
     """Valida formato de placa según tipo de vehículo."""
     if not text or len(text) != 6:
         return False
-    text = text.upper()
-    if vehicle_type == "motorcycle":
-        return bool(re.match(r'^[A-Z]{3}[0-9]{2}[A-Z]$', text))
-    elif vehicle_type in {"car", "bus", "truck"}:
-        return bool(re.match(r'^[A-Z]{3}[0-9]{3}$', text))
-    return len(text) == 6
+    validator = _VALIDATORS.get(vehicle_type)
+    if validator is None:
+        return True
+    return validator.fullmatch(text.upper()) is not None
+
+
+def _execution_providers(precision: str, cache_dir: str = None):
+    """
+    Providers de ONNX Runtime para los modelos de placas según la precisión.
+
+    "fp16" usa TensorRT en FP16 (con caché de engines) si está disponible,
+    con CUDA y CPU como respaldo. "fp32" (o sin TensorRT) retorna None y
+    fast_alpr usa sus providers por defecto.
+    """
+    precision = (precision or 'fp32').lower()
+    if precision == 'fp32':
+        return None
+    if precision != 'fp16':
+        print(f"PLATE_PRECISION '{precision}' no soportada, usando fp32")
+        return None
+
+    available = ort.get_available_providers()
+    if 'TensorrtExecutionProvider' not in available:
+        print("TensorRT no disponible, modelos de placas en fp32")
+        return None
+
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'plate_trt_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    providers = [('TensorrtExecutionProvider', {
+        'trt_fp16_enable': True,
+        'trt_engine_cache_enable': True,
+        'trt_engine_cache_path': cache_dir,
+    })]
+    providers += [p for p in ('CUDAExecutionProvider', 'CPUExecutionProvider') if p in available]
+    return providers
+
+
+def _with_trt_profile(providers, model_path, max_batch: int):
+    """
+    Añade a las opciones de TensorRT un perfil de optimización para el modelo.
+
+    Sin perfil, TensorRT construye el engine para la primera forma de entrada
+    que recibe y lo reconstruye cada vez que cambia el tamaño del lote. El
+    perfil cubre lotes de 1 a max_batch; si la dimensión de lote del modelo
+    es fija, el perfil queda fijo en ese tamaño.
+
+    Returns:
+        Copia de providers con el perfil, o providers sin cambios si el modelo
+        tiene otras dimensiones dinámicas
+    """
+    # Solo se leen los metadatos de la entrada; no se usa TensorRT para esto
+    session = ort.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    model_input = session.get_inputs()[0]
+    batch, *dims = model_input.shape
+    if not all(isinstance(d, int) for d in dims):
+        print(f"{Path(model_path).name}: entrada {model_input.shape} dinámica, sin perfil TensorRT")
+        return providers
+
+    if isinstance(batch, int):
+        min_batch = max_batch = batch
+    else:
+        min_batch = 1
+
+    def shape(n):
+        return f"{model_input.name}:" + 'x'.join(str(d) for d in (n, *dims))
+
+    profile = {
+        'trt_profile_min_shapes': shape(min_batch),
+        'trt_profile_opt_shapes': shape(max_batch),
+        'trt_profile_max_shapes': shape(max_batch),
+    }
+    return [(p[0], {**p[1], **profile}) if isinstance(p, tuple) and p[0] == 'TensorrtExecutionProvider' else p
+            for p in providers]
+
+
+def _vehicle_type_from_name(filename: str) -> str | None:
+    """Infiere el tipo de vehículo del nombre del archivo."""
+    filename_lower = filename.lower()
+    for vtype in VEHICLE_TYPES:
+        if vtype in filename_lower:
+            return vtype
+    return None
+
+
+def _read_batches(files: list, batch_size: int, prefetch: int = 2):
+    """
+    Decodifica imágenes con un pool de hilos y las entrega por lotes.
+
+    Mientras se procesa un lote, los siguientes `prefetch` lotes ya se están
+    decodificando; el límite evita cargar todo el directorio en memoria.
+
+    Yields:
+        Lista de tuplas (ruta, imagen BGR o None si no se pudo leer)
+    """
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        pending = deque()
+        for start in range(0, len(files), batch_size):
+            pending.append([(f, pool.submit(cv2.imread, str(f)))
+                            for f in files[start:start + batch_size]])
+            if len(pending) > prefetch:
+                yield [(f, future.result()) for f, future in pending.popleft()]
+        while pending:
+            yield [(f, future.result()) for f, future in pending.popleft()]
+
+
+class _BatchDetector(BaseDetector):
+    """
+    Detector de placas que procesa varias imágenes por inferencia.
+
+    DefaultDetector de fast_alpr crea el detector con batch_size=1, de modo
+    que predict(lista) ejecuta una inferencia por imagen.
+    """
+
+    def __init__(self, model_name: str, batch_size: int, conf_thresh: float = 0.4, providers=None):
+        self.detector = create_detector(
+            model_name,
+            conf_thresh=conf_thresh,
+            batch_size=batch_size,
+            providers=providers
+        )
+        # El detector usa batch_size=1 si el modelo no tiene dimensión de lote dinámica
+        self.batch_size = self.detector.batch_size
+        if self.batch_size < batch_size:
+            print(f"Detector {model_name} sin lote dinámico: una imagen por inferencia")
+
+    def predict(self, frame):
+        return self.detector.predict(frame)
 
 
 class PlateFilter:
@@ -31,18 +183,33 @@ class PlateFilter:
     def __init__(
         self,
         detector_model: str = "yolo-v9-s-608-license-plate-end2end",
-        ocr_model: str = "global-plates-mobile-vit-v2-model"
+        ocr_model: str = "global-plates-mobile-vit-v2-model",
+        precision: str = "fp32",
+        engine_cache_dir: str = None
     ):
         """
         Args:
             detector_model: Modelo de detección de placas
             ocr_model: Modelo OCR para leer texto
+            precision: "fp32" o "fp16" (TensorRT, si está disponible)
+            engine_cache_dir: Carpeta para los engines TensorRT compilados
         """
+        providers = _execution_providers(precision, engine_cache_dir)
+        detector_providers = ocr_providers = providers
+        if providers:
+            # Un perfil por modelo: el detector recibe lotes de hasta BATCH_SIZE
+            # imágenes y el OCR de 1 a BATCH_SIZE placas según el lote
+            detector_providers = _with_trt_profile(
+                providers, download_detector(detector_model), BATCH_SIZE)
+            ocr_providers = _with_trt_profile(
+                providers, download_ocr(model_name=ocr_model)[0], BATCH_SIZE)
         self.alpr = ALPR(
-            detector_model=detector_model,
-            ocr_model=ocr_model
+            detector=_BatchDetector(detector_model, BATCH_SIZE, providers=detector_providers),
+            ocr_model=ocr_model,
+            ocr_providers=ocr_providers
         )
-        print(f"ALPR inicializado: detector={detector_model}")
+        print(f"ALPR inicializado: detector={detector_model}, "
+              f"precisión={'fp16' if providers else 'fp32'}")
 
     def has_plate(self, image, vehicle_type: str = None, return_text: bool = False):
         """
@@ -62,18 +229,79 @@ class PlateFilter:
             if image is None:
                 return (False, None) if return_text else False
 
-        # Convertir BGR a RGB para fast_alpr
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-        plate_results = self.alpr.predict(image_rgb)
+        found, text = self.has_plates_batch([image], [vehicle_type])[0]
+        return (found, text) if return_text else found
 
-        for result in plate_results:
-            text = result.ocr.text if result.ocr else None
+    def has_plates_batch(self, images: list, vehicle_types: list) -> list[tuple[bool, str | None]]:
+        """
+        Versión por lotes de has_plate: el detector de placas procesa hasta
+        BATCH_SIZE imágenes por inferencia (si el modelo lo admite) y el OCR
+        lee en lote las placas candidatas de todas ellas.
 
-            if text and is_valid_plate(text, vehicle_type):
-                return (True, text.upper()) if return_text else True
+        Args:
+            images: Lista de numpy arrays (BGR)
+            vehicle_types: Tipo de vehículo de cada imagen (o None)
 
-        return (False, None) if return_text else False
+        Returns:
+            Lista de tuplas (bool, texto_placa) en el mismo orden que images
+        """
+        # Convertir BGR a RGB para fast_alpr
+        images_rgb = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images]
+
+        detections_batch = self.alpr.detector.predict(images_rgb)
+        candidates = [
+            self._plate_candidates(image_rgb, detections)
+            for image_rgb, detections in zip(images_rgb, detections_batch)
+        ]
+
+        # OCR por rondas: en cada ronda se lee en un solo lote la siguiente
+        # candidata de las imágenes que aún no tienen placa válida
+        results = [(False, None)] * len(images)
+        for rank in range(MAX_PLATE_CANDIDATES):
+            pending = [i for i, crops in enumerate(candidates)
+                       if not results[i][0] and rank < len(crops)]
+            if not pending:
+                break
+            texts = self._ocr_batch([candidates[i][rank] for i in pending])
+            for i, text in zip(pending, texts):
+                if text and is_valid_plate(text, vehicle_types[i]):
+                    results[i] = (True, text.upper())
+        return results
+
+    def _plate_candidates(self, image_rgb, detections) -> list:
+        """
+        Recorta las placas detectadas, de mayor a menor confianza, descartando
+        las demasiado pequeñas para el OCR.
+        """
+        h, w = image_rgb.shape[:2]
+        crops = []
+        for detection in sorted(detections, key=lambda d: d.confidence, reverse=True):
+            bbox = detection.bounding_box
+            x1, y1 = max(bbox.x1, 0), max(bbox.y1, 0)
+            x2, y2 = min(bbox.x2, w), min(bbox.y2, h)
+            if x2 - x1 < MIN_PLATE_WIDTH or y2 - y1 < MIN_PLATE_HEIGHT:
+                continue
+            crops.append(image_rgb[y1:y2, x1:x2])
+            if len(crops) == MAX_PLATE_CANDIDATES:
+                break
+        return crops
+
+    def _ocr_batch(self, crops: list) -> list[str | None]:
+        """Ejecuta el OCR sobre varias placas en una sola inferencia."""
+        ocr = self.alpr.ocr
+        recognizer = getattr(ocr, 'ocr_model', None)
+        if recognizer is None:
+            # OCR personalizado sin acceso al modelo: una inferencia por placa
+            results = [ocr.predict(crop) for crop in crops]
+            return [r.text if r else None for r in results]
+
+        # Misma conversión de color que DefaultOCR.predict
+        color_mode = recognizer.config.image_color_mode
+        if color_mode == "grayscale":
+            crops = [cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) for crop in crops]
+        elif color_mode == "rgb":
+            crops = [cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) for crop in crops]
+        return [prediction.plate for prediction in recognizer.run(crops)]
 
     def filter_directory(
         self,
@@ -81,7 +309,8 @@ class PlateFilter:
         output_dir: str = None,
         delete_no_plate: bool = False,
         copy_mode: bool = True,
-        save_plate_text: bool = False
+        save_plate_text: bool = False,
+        batch_size: int = BATCH_SIZE
     ) -> dict:
         """
         Filtra imágenes de un directorio por presencia de placa válida.
@@ -92,6 +321,7 @@ class PlateFilter:
             delete_no_plate: Si True, elimina imágenes sin placa
             copy_mode: Si True copia, si False mueve
             save_plate_text: Si True, guarda archivo con textos de placas
+            batch_size: Imágenes por lote de inferencia
 
         Returns:
             dict con estadísticas
@@ -111,38 +341,44 @@ class PlateFilter:
         stats = {"total": len(images), "with_plate": 0, "without_plate": 0}
         plate_texts = []
 
-        for i, img_file in enumerate(images):
-            image = cv2.imread(str(img_file))
-            if image is None:
+        processed = 0
+        for batch in _read_batches(images, batch_size):
+            batch_files = []
+            batch_images = []
+            batch_types = []
+            for img_file, image in batch:
+                if image is None:
+                    continue
+                batch_files.append(img_file)
+                batch_images.append(image)
+                batch_types.append(_vehicle_type_from_name(img_file.name))
+
+            previous = processed
+            processed += len(batch)
+
+            if not batch_images:
                 continue
 
-            # Inferir tipo de vehículo del nombre del archivo
-            filename_lower = img_file.name.lower()
-            vehicle_type = None
-            for vtype in ["motorcycle", "car", "bus", "truck"]:
-                if vtype in filename_lower:
-                    vehicle_type = vtype
-                    break
+            results = self.has_plates_batch(batch_images, batch_types)
 
-            has_plate, text = self.has_plate(image, vehicle_type=vehicle_type, return_text=True)
+            for img_file, (has_plate, text) in zip(batch_files, results):
+                if has_plate:
+                    stats["with_plate"] += 1
+                    plate_texts.append(f"{img_file.name}: {text}")
 
-            if has_plate:
-                stats["with_plate"] += 1
-                plate_texts.append(f"{img_file.name}: {text}")
-
-                if output_dir:
-                    dest = output_path / img_file.name
-                    if copy_mode:
-                        shutil.copy2(img_file, dest)
-                    else:
-                        shutil.move(img_file, dest)
-            else:
-                stats["without_plate"] += 1
-                if delete_no_plate:
-                    img_file.unlink()
-
-            if (i + 1) % 50 == 0:
-                print(f"Procesadas {i+1}/{len(images)} imágenes")
+                    if output_dir:
+                        dest = output_path / img_file.name
+                        if copy_mode:
+                            shutil.copy2(img_file, dest)
+                        else:
+                            shutil.move(img_file, dest)
+                else:
+                    stats["without_plate"] += 1
+                    if delete_no_plate:
+                        img_file.unlink()
+
+            if processed // 50 > previous // 50:
+                print(f"Procesadas {processed}/{len(images)} imágenes")
 
         # Guardar textos de placas
         if save_plate_text and plate_texts:
@@ -155,7 +391,7 @@ class PlateFilter:
         return stats
 
 
-def filter_crops_by_plate(crops_dict: dict, plate_filter: PlateFilter) -> dict:
+def filter_crops_by_plate(crops_dict: dict, plate_filter: PlateFilter, batch_size: int = BATCH_SIZE) -> dict:
     """
     Filtra diccionario de crops eliminando los que no tienen placa válida.
     Para usar desde vehicle_extractor.py
@@ -163,15 +399,23 @@ def filter_crops_by_plate(crops_dict: dict, plate_filter: PlateFilter) -> dict:
     Args:
         crops_dict: {track_id: {"image": np.array, "class": str, ...}}
         plate_filter: Instancia de PlateFilter
+        batch_size: Crops por lote de inferencia
 
     Returns:
         Diccionario filtrado solo con vehículos que tienen placa válida
     """
+    items = [(track_id, data) for track_id, data in crops_dict.items()
+             if data["image"] is not None]
+
     filtered = {}
-    for track_id, data in crops_dict.items():
-        if data["image"] is not None:
-            vehicle_type = data.get("class")
-            if plate_filter.has_plate(data["image"], vehicle_type=vehicle_type):
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        results = plate_filter.has_plates_batch(
+            [data["image"] for _, data in batch],
+            [data.get("class") for _, data in batch]
+        )
+        for (track_id, data), (has_plate, _) in zip(batch, results):
+            if has_plate:
                 filtered[track_id] = data
     return filtered
 
@@ -186,10 +430,12 @@ if __name__ == "__main__":
                         help="Mover en vez de copiar")
     parser.add_argument("--save-text", action="store_true",
                         help="Guardar archivo con textos de placas detectadas")
+    parser.add_argument("--precision", choices=["fp32", "fp16"], default="fp32",
+                        help="Precisión de los modelos de placas (fp16 requiere TensorRT)")
 
     args = parser.parse_args()
 
-    pf = PlateFilter()
+    pf = PlateFilter(precision=args.precision)
     pf.filter_directory(
         args.input,
         output_dir=args.output,
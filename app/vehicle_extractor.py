@@ -6,10 +6,15 @@ Requiere: pip install ultralytics opencv-python
 import cv2
 import os
 import argparse
+import multiprocessing
+import queue
+import threading
 import numpy as np
+import torch
 from pathlib import Path
 from ultralytics import YOLO
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 
 # Clases COCO relevantes para vehículos
@@ -20,88 +25,307 @@ VEHICLE_CLASSES = {
     7: "truck"
 }
 
+# Frames decodificados que pueden esperar en cola mientras YOLO procesa un lote
+FRAME_QUEUE_SIZE = 32
 
-def compute_histogram(image, bins=64):
-    """Calcula histograma de color normalizado para comparación."""
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    hist = cv2.calcHist([hsv], [0, 1, 2], None, [bins, bins, bins], [0, 180, 0, 256, 0, 256])
-    cv2.normalize(hist, hist)
-    return hist.flatten()
+# Hilos para escribir los JPEG en disco
+IO_WORKERS = 4
 
+# Frames sin detectar un track para darlo por terminado; mayor que el
+# track_buffer del tracker (30) para que su ID no reaparezca
+TRACK_IDLE_FRAMES = 60
 
-def is_duplicate(new_crop, existing_crops, threshold=0.85):
+
+def compute_histograms_batch(images, bins=32, size=128):
     """
-    Verifica si new_crop es similar a alguno de los crops existentes.
-    Usa correlación de histogramas.
+    Calcula los histogramas de color Hue-Saturation de varios crops a la vez.
+
+    Cada crop se redimensiona a size x size y el lote completo se convierte
+    a HSV en una sola llamada; los histogramas se acumulan con un solo
+    scatter_add_ en el dispositivo de torch disponible (GPU si existe).
+
+    Cada histograma se centra y normaliza (L2), de modo que el producto punto
+    entre dos histogramas es su correlación (equivalente a HISTCMP_CORREL).
+
+    Returns:
+        torch.Tensor de forma (K, bins * bins)
     """
-    if len(existing_crops) == 0:
-        return False
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    resized = np.stack([
+        cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+        for image in images
+    ])
+    # Una conversión BGR→HSV por lote, sobre los crops ya reducidos
+    hsv = cv2.cvtColor(resized.reshape(-1, size, 3), cv2.COLOR_BGR2HSV)
+    hsv = torch.from_numpy(hsv).to(device).long().reshape(len(images), size, size, 3)
 
-    new_hist = compute_histogram(new_crop)
+    # Índice de bin por pixel: H en [0, 180), S en [0, 256)
+    h_bins = hsv[..., 0] * bins // 180
+    s_bins = hsv[..., 1] * bins // 256
+    index = (h_bins * bins + s_bins).reshape(len(images), -1)
 
-    for existing in existing_crops:
-        existing_hist = compute_histogram(existing["image"])
-        # Correlación: 1.0 = idénticos, 0 = completamente diferentes
-        similarity = cv2.compareHist(new_hist, existing_hist, cv2.HISTCMP_CORREL)
-        if similarity > threshold:
-            return True
+    hists = torch.zeros((len(images), bins * bins), dtype=torch.float32, device=device)
+    hists.scatter_add_(1, index, torch.ones_like(index, dtype=torch.float32))
 
-    return False
+    hists -= hists.mean(dim=1, keepdim=True)
+    return torch.nn.functional.normalize(hists, dim=1)
 
 
-def deduplicate_crops(crops_dict, similarity_threshold=0.85):
+def select_unique(entries, hists, similarity_threshold=0.85) -> list:
     """
-    Elimina duplicados visuales del diccionario de crops.
-    Agrupa por clase y compara dentro de cada clase.
+    Deduplicación sobre histogramas ya calculados.
+    Agrupa por clase y, dentro de cada clase, conserva los de mayor área.
+
+    Args:
+        entries: Lista de dicts con "track_id", "class" y "area"
+        hists: Tensor (N, D) con el histograma de cada entrada, o lista de
+            tensores por lote en el mismo orden que entries
+        similarity_threshold: Correlación a partir de la cual dos crops son duplicados
+
+    Returns:
+        Lista de track_ids únicos
     """
+    if isinstance(hists, list):
+        hists = torch.cat(hists)
+
     # Agrupar por clase
     by_class = defaultdict(list)
-    for track_id, data in crops_dict.items():
-        if data["image"] is not None:
-            by_class[data["class"]].append({"track_id": track_id, **data})
+    for i, entry in enumerate(entries):
+        by_class[entry["class"]].append(i)
 
     # Deduplicar dentro de cada clase
-    unique_crops = {}
-    for cls_name, crops in by_class.items():
+    unique = []
+    for indices in by_class.values():
         # Ordenar por área (mayor primero) para quedarnos con los mejores
-        crops.sort(key=lambda x: x["area"], reverse=True)
-
-        kept = []
-        for crop in crops:
-            if not is_duplicate(crop["image"], kept, similarity_threshold):
-                kept.append(crop)
-                unique_crops[crop["track_id"]] = {
-                    "image": crop["image"],
-                    "area": crop["area"],
-                    "class": crop["class"],
-                    "conf": crop["conf"]
-                }
+        indices.sort(key=lambda i: entries[i]["area"], reverse=True)
 
+        # Correlación entre todos los pares: 1.0 = idénticos, 0 = completamente diferentes
+        class_hists = hists[indices]
+        similar = ((class_hists @ class_hists.T) > similarity_threshold).cpu().numpy()
+
+        # Cada crop conservado descarta de una vez a todos sus vecinos similares
+        suppressed = np.zeros(len(indices), dtype=bool)
+        for j, i in enumerate(indices):
+            if not suppressed[j]:
+                suppressed |= similar[j]
+                unique.append(entries[i]["track_id"])
+
+    return unique
+
+
+def deduplicate_crops(crops_dict, similarity_threshold=0.85):
+    """
+    Elimina duplicados visuales del diccionario de crops.
+    Agrupa por clase y compara dentro de cada clase.
+    """
+    entries = [
+        {"track_id": track_id, "class": data["class"], "area": data["area"]}
+        for track_id, data in crops_dict.items()
+        if data["image"] is not None
+    ]
+    if not entries:
+        return {}
+
+    hists = compute_histograms_batch([crops_dict[e["track_id"]]["image"] for e in entries])
+
+    unique_crops = {}
+    for track_id in select_unique(entries, hists, similarity_threshold):
+        data = crops_dict[track_id]
+        unique_crops[track_id] = {
+            "image": data["image"],
+            "area": data["area"],
+            "class": data["class"],
+            "conf": data["conf"]
+        }
     return unique_crops
 
 
-def extract_vehicles_to_dict(video_path: str, config) -> dict:
+def _iter_frame_batches(video_path: str, batch_size: int, scale: float = 1.0):
     """
-    Versión que retorna dict en memoria en lugar de guardar archivos.
-    Usada por video_processor.py
+    Decodifica el video en un hilo aparte y entrega lotes de frames (BGR).
 
-    Args:
-        video_path: Ruta al video
-        config: Objeto de configuración con atributos YOLO_MODEL, YOLO_CONF_THRESHOLD, etc.
+    La cola acotada deja que el decodificador adelante hasta
+    FRAME_QUEUE_SIZE frames mientras el modelo procesa el lote actual.
+    Con scale < 1 los frames se reducen en el mismo hilo al decodificarlos.
+    """
+    frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item):
+        # Reintentar hasta que haya espacio o el consumidor haya terminado
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-    Returns:
-        {track_id: {"image": np.array, "area": int, "class": str, "conf": float}}
+    def decode():
+        cap = cv2.VideoCapture(video_path)
+        try:
+            while True:
+                ok, frame = cap.read()
+                if ok and scale < 1.0:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale,
+                                       interpolation=cv2.INTER_AREA)
+                if not ok or not put(frame):
+                    break
+        finally:
+            cap.release()
+            put(None)
+
+    decoder = threading.Thread(target=decode, name="frame-decoder", daemon=True)
+    decoder.start()
+    try:
+        batch = []
+        while (frame := frames.get()) is not None:
+            batch.append(frame)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        stop.set()
+        decoder.join()
+
+
+def _track_video(model, video_path: str, batch_size: int, scale: float = 1.0, **track_kwargs):
+    """
+    Ejecuta model.track sobre lotes de frames y entrega los resultados en orden.
+
+    Con persist=True el tracker de YOLO conserva los IDs entre lotes.
+    """
+    for batch in _iter_frame_batches(video_path, batch_size, scale):
+        yield from model.track(source=batch, **track_kwargs)
+
+
+def load_model(model_name: str, half: bool = True):
+    """
+    Carga el modelo YOLO (en GPU si está disponible) y lo deja listo para usar.
+
+    El modelo devuelto puede reutilizarse entre videos pasándolo a
+    extract_vehicles_to_dict, evitando recargar los pesos y el contexto CUDA.
+
+    Args:
+        model_name: Modelo YOLO a cargar
+        half: Inferencia en FP16 (solo en GPU)
     """
     # Cargar modelo (automáticamente usa GPU si está disponible)
-    model = YOLO(config.YOLO_MODEL)
+    model = YOLO(model_name)
     try:
         model.to('cuda')
     except:
         pass  # Si no hay GPU, se queda en CPU
 
     # Verificar si usa GPU
+    print(f"Usando dispositivo: {model.device}")
+
+    # Inferencia de calentamiento: inicializa el predictor y los kernels.
+    # La precisión queda fijada aquí, al crear el predictor.
+    model.predict(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False,
+                  half=half and model.device.type == 'cuda')
+    return model
+
+
+def _reset_trackers(model):
+    """Reinicia el tracker de un modelo reutilizado para que no mezcle IDs entre videos."""
+    for tracker in getattr(model.predictor, "trackers", []):
+        tracker.reset()
+
+
+def write_jpeg(filepath, image) -> bool:
+    """
+    Codifica la imagen a JPEG en memoria y la escribe con una sola llamada a os.write.
+
+    Evita la capa de fopen/fwrite con buffer de cv2.imwrite.
+
+    Returns:
+        True si la imagen se codificó y escribió completa
+    """
+    ok, buf = cv2.imencode('.jpg', image)
+    if not ok:
+        return False
+    write_file(filepath, buf)
+    return True
+
+
+def write_file(filepath, data):
+    """Escribe un buffer (bytes o array) directamente con os.open/os.write."""
+    data = memoryview(data).cast('B')
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+def wait_writes(writes) -> int:
+    """
+    Espera escrituras enviadas a un pool y cuenta las que terminaron bien.
+
+    Args:
+        writes: Lista de (filepath, future de write_jpeg)
+
+    Returns:
+        Número de imágenes escritas; los fallos se informan por consola
+    """
+    saved = 0
+    for filepath, future in writes:
+        try:
+            ok = future.result()
+        except Exception as e:
+            print(f"Error guardando {filepath}: {e}")
+            continue
+        if ok:
+            saved += 1
+        else:
+            print(f"Error codificando {filepath}")
+    return saved
+
+
+def _track_result(data: dict) -> dict:
+    """Datos públicos del mejor crop de un track."""
+    return {
+        "image": data["image"],
+        "area": data["area"],
+        "class": data["class"],
+        "conf": data["conf"]
+    }
+
+
+def _materialize_crops(best_crops, track_ids: set):
+    """Copia los crops guardados como vistas para liberar los frames de los que provienen."""
+    for track_id in track_ids:
+        best_crops[track_id]["image"] = best_crops[track_id]["image"].copy()
+    track_ids.clear()
+
+
+def extract_vehicles_iter(video_path: str, config, model=None, scale: float = 1.0):
+    """
+    Recorre el video y entrega el mejor crop de cada track en cuanto termina,
+    sin deduplicar. Un track termina cuando lleva TRACK_IDLE_FRAMES frames
+    sin detectarse, o al acabar el video.
+
+    Args:
+        video_path: Ruta al video
+        config: Objeto de configuración con atributos YOLO_MODEL, YOLO_CONF_THRESHOLD, etc.
+        model: Modelo YOLO ya cargado con load_model (None = cargar config.YOLO_MODEL)
+        scale: Factor de reducción aplicado a cada frame al decodificar (1.0 = original)
+
+    Yields:
+        (track_id, {"image": np.array, "area": int, "class": str, "conf": float})
+    """
+    half = bool(getattr(config, 'YOLO_HALF', True))
+
+    if model is None:
+        model = load_model(config.YOLO_MODEL, half=half)
+    else:
+        _reset_trackers(model)
+
     device = model.device
-    print(f"Usando dispositivo: {device}")
 
     # Almacenar el mejor crop por cada track_id
     best_crops = defaultdict(lambda: {"area": 0, "image": None, "class": None, "conf": 0, "is_complete": False})
@@ -110,19 +334,42 @@ def extract_vehicles_to_dict(video_path: str, config) -> dict:
     min_area = int(config.YOLO_MIN_AREA)
     best_frame_strategy = config.YOLO_STRATEGY
 
-    # Procesar video con tracking integrado de YOLO
-    results = model.track(
-        source=video_path,
+    batch_size = int(getattr(config, 'YOLO_BATCH_SIZE', 8))
+
+    # Procesar video con tracking integrado de YOLO, por lotes de frames
+    results = _track_video(
+        model,
+        video_path,
+        batch_size=batch_size,
+        scale=scale,
         classes=list(VEHICLE_CLASSES.keys()),  # Solo vehículos
         conf=conf_threshold,
-        stream=True,
         persist=True,
         verbose=False,
+        half=half and device.type == 'cuda',
         device=0 if device.type == 'cuda' else 'cpu'
     )
 
+    # Track IDs cuyo crop aún es una vista sobre un frame del lote actual
+    pending_views = set()
+    # Último frame en que se vio cada track, y tracks ya entregados
+    last_seen = {}
+    emitted = set()
+
     frame_count = 0
     for result in results:
+        # Empieza un lote nuevo: copiar los crops que apuntan al lote anterior
+        # y entregar los tracks que ya terminaron
+        if frame_count % batch_size == 0:
+            _materialize_crops(best_crops, pending_views)
+            finished = [track_id for track_id, seen in last_seen.items()
+                        if frame_count - seen > TRACK_IDLE_FRAMES]
+            for track_id in finished:
+                del last_seen[track_id]
+                emitted.add(track_id)
+                data = best_crops.pop(track_id, None)
+                if data is not None and data["image"] is not None:
+                    yield track_id, _track_result(data)
         frame_count += 1
 
         if result.boxes is None or len(result.boxes) == 0:
@@ -137,29 +384,38 @@ def extract_vehicles_to_dict(video_path: str, config) -> dict:
         frame = result.orig_img
         h, w = frame.shape[:2]
 
-        for i, box in enumerate(boxes):
-            track_id = int(box.id[0])
-            cls_id = int(box.cls[0])
-            conf = float(box.conf[0])
-
-            # Obtener coordenadas del bounding box
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-            # Calcular área
-            area = (x2 - x1) * (y2 - y1)
+        # Pasar todas las detecciones del frame a CPU de una sola vez
+        ids = boxes.id.int().cpu().numpy()
+        classes = boxes.cls.int().cpu().numpy()
+        confs = boxes.conf.float().cpu().numpy()
+        xyxy = boxes.xyxy.int().cpu().numpy()
+
+        for track_id in ids.tolist():
+            if track_id not in emitted:
+                last_seen[track_id] = frame_count
+
+        # Calcular área
+        areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+
+        # Verificar si el vehículo está completo (no toca los bordes)
+        margin_border = 10
+        complete = (
+            (xyxy[:, 0] >= margin_border) &
+            (xyxy[:, 1] >= margin_border) &
+            (xyxy[:, 2] <= w - margin_border) &
+            (xyxy[:, 3] <= h - margin_border)
+        )
 
-            # Ignorar detecciones muy pequeñas
-            if area < min_area:
+        # Ignorar detecciones muy pequeñas
+        for i in np.flatnonzero(areas >= min_area):
+            track_id = int(ids[i])
+            if track_id in emitted:
                 continue
-
-            # Verificar si el vehículo está completo (no toca los bordes)
-            margin_border = 10
-            is_complete = (
-                x1 >= margin_border and
-                y1 >= margin_border and
-                x2 <= w - margin_border and
-                y2 <= h - margin_border
-            )
+            cls_id = int(classes[i])
+            conf = float(confs[i])
+            x1, y1, x2, y2 = xyxy[i].tolist()
+            area = int(areas[i])
+            is_complete = bool(complete[i])
 
             # Decidir si guardar este crop
             current = best_crops[track_id]
@@ -186,7 +442,10 @@ def extract_vehicles_to_dict(video_path: str, config) -> dict:
                 x2_safe = min(w, x2 + margin)
                 y2_safe = min(h, y2 + margin)
 
-                crop = frame[y1_safe:y2_safe, x1_safe:x2_safe].copy()
+                # Vista sin copia; si el track mejora dentro del mismo lote
+                # la vista se reemplaza y nunca llega a copiarse
+                crop = frame[y1_safe:y2_safe, x1_safe:x2_safe]
+                pending_views.add(track_id)
 
                 best_crops[track_id] = {
                     "image": crop,
@@ -197,16 +456,77 @@ def extract_vehicles_to_dict(video_path: str, config) -> dict:
                 }
 
         if frame_count % 100 == 0:
-            print(f"Procesados {frame_count} frames, {len(best_crops)} vehículos detectados")
+            print(f"Procesados {frame_count} frames, {len(best_crops) + len(emitted)} vehículos detectados")
+
+    _materialize_crops(best_crops, pending_views)
+    for track_id, data in best_crops.items():
+        if data["image"] is not None:
+            yield track_id, _track_result(data)
+
+
+def extract_vehicles_to_dict(video_path: str, config, model=None, scale: float = 1.0) -> dict:
+    """
+    Versión que retorna dict en memoria en lugar de guardar archivos.
+
+    Args:
+        video_path: Ruta al video
+        config: Objeto de configuración con atributos YOLO_MODEL, YOLO_CONF_THRESHOLD, etc.
+        model: Modelo YOLO ya cargado con load_model (None = cargar config.YOLO_MODEL)
+        scale: Factor de reducción aplicado a cada frame al decodificar (1.0 = original)
+
+    Returns:
+        {track_id: {"image": np.array, "area": int, "class": str, "conf": float}}
+    """
+    crops = dict(extract_vehicles_iter(video_path, config, model=model, scale=scale))
 
     print(f"\nDeduplicando visualmente...")
     similarity_threshold = float(config.YOLO_SIMILARITY_THRESHOLD)
-    unique_crops = deduplicate_crops(best_crops, similarity_threshold=similarity_threshold)
-    print(f"Reducido de {len(best_crops)} a {len(unique_crops)} vehículos únicos")
+    unique_crops = deduplicate_crops(crops, similarity_threshold=similarity_threshold)
+    print(f"Reducido de {len(crops)} a {len(unique_crops)} vehículos únicos")
 
     return unique_crops
 
 
+def _extract_crops(
+    video_path: str,
+    model_name: str = "yolo11m.pt",
+    conf_threshold: float = 0.5,
+    best_frame_strategy: str = "complete",
+    similarity_threshold: float = 0.80,
+    min_area: int = 40000,
+    model=None
+) -> dict:
+    """Ejecuta extract_vehicles_to_dict con los parámetros de la CLI."""
+    # Crear objeto config simulado para reusar extract_vehicles_to_dict
+    class Config:
+        YOLO_MODEL = model_name
+        YOLO_CONF_THRESHOLD = conf_threshold
+        YOLO_STRATEGY = best_frame_strategy
+        YOLO_SIMILARITY_THRESHOLD = similarity_threshold
+        YOLO_MIN_AREA = min_area
+        YOLO_BATCH_SIZE = 8
+        YOLO_HALF = True
+
+    return extract_vehicles_to_dict(video_path, Config(), model=model)
+
+
+def _queue_writes(unique_crops: dict, output_path: Path, video_name: str, io_pool) -> list:
+    """
+    Envía a io_pool la escritura de cada crop sin esperar a que termine.
+
+    Returns:
+        Lista de (filepath, future) para contarlas con wait_writes
+    """
+    output_path.mkdir(parents=True, exist_ok=True)
+    writes = []
+    for track_id, data in unique_crops.items():
+        if data["image"] is not None:
+            filename = f"{video_name}_{data['class']}_id{track_id}_conf{data['conf']:.2f}.jpg"
+            filepath = output_path / filename
+            writes.append((filepath, io_pool.submit(write_jpeg, filepath, data["image"])))
+    return writes
+
+
 def extract_vehicles(
     video_path: str,
     output_dir: str,
@@ -214,7 +534,8 @@ def extract_vehicles(
     conf_threshold: float = 0.5,
     best_frame_strategy: str = "complete",
     similarity_threshold: float = 0.80,
-    min_area: int = 40000
+    min_area: int = 40000,
+    model=None
 ):
     """
     Extrae un recuadro por cada vehículo único detectado en el video.
@@ -228,34 +549,21 @@ def extract_vehicles(
         best_frame_strategy: "complete" (vehículo entero), "largest", o "first"
         similarity_threshold: Umbral para considerar dos crops como duplicados (0.0-1.0)
         min_area: Área mínima en píxeles
-    """
-    # Crear objeto config simulado para reusar extract_vehicles_to_dict
-    class Config:
-        YOLO_MODEL = model_name
-        YOLO_CONF_THRESHOLD = conf_threshold
-        YOLO_STRATEGY = best_frame_strategy
-        YOLO_SIMILARITY_THRESHOLD = similarity_threshold
-        YOLO_MIN_AREA = min_area
-
-    config = Config()
+        model: Modelo YOLO ya cargado con load_model (None = cargar model_name)
 
+    Returns:
+        Número de imágenes guardadas
+    """
     # Extraer vehículos
-    unique_crops = extract_vehicles_to_dict(video_path, config)
+    unique_crops = _extract_crops(video_path, model_name, conf_threshold, best_frame_strategy,
+                                  similarity_threshold, min_area, model=model)
 
-    # Crear directorio de salida
     output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
-
     video_name = Path(video_path).stem
 
-    # Guardar todos los crops
-    saved_count = 0
-    for track_id, data in unique_crops.items():
-        if data["image"] is not None:
-            filename = f"{video_name}_{data['class']}_id{track_id}_conf{data['conf']:.2f}.jpg"
-            filepath = output_path / filename
-            cv2.imwrite(str(filepath), data["image"])
-            saved_count += 1
+    # Guardar todos los crops en paralelo
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as io_pool:
+        saved_count = wait_writes(_queue_writes(unique_crops, output_path, video_name, io_pool))
 
     print(f"\nCompletado: {saved_count} vehículos únicos guardados")
     print(f"Guardados en: {output_path}")
@@ -263,19 +571,88 @@ def extract_vehicles(
     return saved_count
 
 
-def process_multiple_videos(video_dir: str, output_dir: str, **kwargs):
-    """Procesa múltiples videos de una carpeta."""
+# Modelo cargado por cada proceso worker de process_multiple_videos
+_worker_model = None
+
+
+def _init_worker(model_name: str, devices):
+    """Inicializa un proceso worker: fija su GPU y carga el modelo una sola vez."""
+    global _worker_model  # pylint: disable=global-statement
+    device = devices.get()
+    if device is not None:
+        # Debe fijarse antes de inicializar CUDA en este proceso
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(device)
+    _worker_model = load_model(model_name)
+
+
+def _process_one(task, model=None, io_pool=None):
+    """
+    Procesa un video con el modelo dado o, en un proceso worker, con el suyo.
+
+    Returns:
+        Número de imágenes guardadas o, con io_pool, la lista de escrituras
+        pendientes (ver _queue_writes): así se escriben las imágenes de un
+        video mientras YOLO procesa el siguiente
+    """
+    video_file, output_dir, kwargs = task
+    print(f"\n{'='*50}")
+    print(f"Procesando: {Path(video_file).name}")
+    print('='*50)
+    if io_pool is None:
+        return extract_vehicles(video_file, output_dir, model=model or _worker_model, **kwargs)
+
+    unique_crops = _extract_crops(video_file, model=model, **kwargs)
+    writes = _queue_writes(unique_crops, Path(output_dir), Path(video_file).stem, io_pool)
+    print(f"\n{len(writes)} vehículos únicos en cola de escritura en {output_dir}")
+    return writes
+
+
+def process_multiple_videos(video_dir: str, output_dir: str, workers: int = None, **kwargs):
+    """
+    Procesa múltiples videos de una carpeta.
+
+    Args:
+        video_dir: Carpeta con videos
+        output_dir: Carpeta de salida para los recuadros
+        workers: Procesos en paralelo, cada uno con su propio modelo
+            (None = uno por GPU, o 1 si no hay GPU)
+        **kwargs: Parámetros de extract_vehicles
+    """
     video_extensions = {'.mp4', '.avi', '.mov', '.mkv', '.webm'}
     video_dir = Path(video_dir)
+    model_name = kwargs.get("model_name", "yolo11m.pt")
+
+    tasks = [(str(video_file), output_dir, kwargs)
+             for video_file in video_dir.iterdir()
+             if video_file.suffix.lower() in video_extensions]
+    if not tasks:
+        print(f"No se encontraron videos en {video_dir}")
+        return
+
+    gpu_count = torch.cuda.device_count()
+    if workers is None:
+        workers = max(1, gpu_count)
+    workers = max(1, min(workers, len(tasks)))
+
+    if workers == 1:
+        # Cargar el modelo una sola vez para todos los videos
+        model = load_model(model_name)
+        # Las imágenes de un video se escriben mientras YOLO procesa el siguiente
+        with ThreadPoolExecutor(max_workers=IO_WORKERS) as io_pool:
+            pending = [_process_one(task, model, io_pool) for task in tasks]
+            counts = [wait_writes(writes) for writes in pending]
+    else:
+        # spawn: CUDA no puede usarse en procesos creados con fork
+        ctx = multiprocessing.get_context("spawn")
+        devices = ctx.Queue()
+        for i in range(workers):
+            devices.put(i % gpu_count if gpu_count else None)
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(model_name, devices)) as executor:
+            counts = list(executor.map(_process_one, tasks, chunksize=max(1, len(tasks) // (workers + 2))))
 
-    total = 0
-    for video_file in video_dir.iterdir():
-        if video_file.suffix.lower() in video_extensions:
-            print(f"\n{'='*50}")
-            print(f"Procesando: {video_file.name}")
-            print('='*50)
-            count = extract_vehicles(str(video_file), output_dir, **kwargs)
-            total += count
+    total = sum(counts)
 
     print(f"\n{'='*50}")
     print(f"TOTAL: {total} vehículos extraídos de todos los videos")
@@ -292,6 +669,8 @@ if __name__ == "__main__":
                         help="Umbral de similitud para deduplicación (0.0-1.0, mayor=más estricto)")
     parser.add_argument("--min-area", type=int, default=40000,
                         help="Área mínima en píxeles (default: 40000 = 200x200)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Procesos en paralelo para carpetas (default: uno por GPU)")
     parser.add_argument("--strategy", choices=["largest", "first", "complete"], default="complete",
                         help="Estrategia: 'complete' (vehículo entero), 'largest' (mayor área), 'first' (más rápido)")
 
@@ -302,6 +681,7 @@ if __name__ == "__main__":
     if input_path.is_dir():
         process_multiple_videos(
             args.input, args.output,
+            workers=args.workers,
             model_name=args.model,
             conf_threshold=args.conf,
             best_frame_strategy=args.strategy,
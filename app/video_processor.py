@@ -4,15 +4,32 @@ Extrae vehículos únicos y filtra por presencia de placa válida.
 """
 
 import asyncio
+import json
 import logging
+import os
 import subprocess
 import shutil
 import time
 import cv2
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import Optional
 
+try:
+    import av
+except ImportError:
+    av = None
+
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+    _turbojpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG o libturbojpeg no disponibles: se usa cv2.imencode
+    _turbojpeg = None
+
 try:
     from . import vehicle_extractor
     from . import plate_filter as plate_filter_module
@@ -25,7 +42,64 @@ except ImportError:
 log = logging.getLogger('video_processor')
 
 
-@dataclass
+def _encode_jpeg(image) -> Optional[bytes]:
+    """Codifica una imagen BGR a JPEG en memoria (None si falla)."""
+    if _turbojpeg is not None:
+        # Misma calidad y submuestreo 4:2:0 que cv2.imencode por defecto
+        return _turbojpeg.encode(image, quality=95, jpeg_subsample=TJSAMP_420)
+    ok, buf = cv2.imencode('.jpg', image)
+    return buf.tobytes() if ok else None
+
+
+def _write_jpeg(filepath: Path, image) -> bool:
+    """Codifica una imagen BGR y la escribe como JPEG."""
+    data = _encode_jpeg(image)
+    if data is None:
+        return False
+    vehicle_extractor.write_file(filepath, data)
+    return True
+
+
+def _probe_resolution(video_path: str) -> tuple[int, int]:
+    """
+    Obtiene (ancho, alto) del primer stream de video.
+
+    El resultado se cachea por ruta, fecha de modificación y tamaño, así
+    los reintentos del mismo archivo no vuelven a leerlo.
+    """
+    st = os.stat(video_path)
+    return _probe_dims(video_path, st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=256)
+def _probe_dims(video_path: str, mtime_ns: int, size: int) -> tuple[int, int]:
+    """
+    Lee la cabecera con PyAV dentro del proceso; si PyAV no está instalado
+    o no puede abrir el archivo, recurre a ffprobe.
+
+    mtime_ns y size solo forman parte de la clave de caché.
+    """
+    if av is not None:
+        try:
+            with av.open(video_path) as container:
+                stream = container.streams.video[0]
+                return stream.codec_context.width, stream.codec_context.height
+        except Exception as e:
+            log.debug(f"[SCALE] PyAV no pudo leer {video_path}, usando ffprobe: {e}")
+
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height',
+        '-of', 'json',
+        video_path
+    ]
+    result = subprocess.run(cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=True)
+    stream = json.loads(result.stdout)['streams'][0]
+    return int(stream['width']), int(stream['height'])
+
+
+@dataclass(slots=True)
 class ProcessingInfo:
     """Tracks the processing status of a video."""
     id: str
@@ -44,7 +118,8 @@ class ProcessingInfo:
     download_dir: str = ''
 
     def to_dict(self):
-        return asdict(self)
+        # Copia plana: todos los campos son escalares, no hace falta asdict
+        return {k: getattr(self, k) for k in self.__slots__}
 
 
 class ProcessingQueueNotifier:
@@ -64,7 +139,7 @@ class ProcessingQueueNotifier:
 
 
 class VideoProcessingQueue:
-    """Cola de procesamiento secuencial para videos."""
+    """Cola de procesamiento de videos en pipeline de tres etapas."""
 
     def __init__(self, config, notifier: Optional[ProcessingQueueNotifier] = None):
         """
@@ -73,18 +148,41 @@ class VideoProcessingQueue:
             notifier: Optional notifier for status updates
         """
         self.queue = asyncio.Queue()
+        # Colas entre etapas; tamaño 1 para no acumular crops en memoria
+        self._extract_q = asyncio.Queue(maxsize=1)
+        self._save_q = asyncio.Queue(maxsize=1)
+        self._workers = {}  # etapa -> asyncio.Task
+        self._busy = set()  # etapas procesando un video en este momento
+        self._stopping = False
         self.processing_lock = asyncio.Lock()
-        self.worker_task = None
         self.config = config
         self.notifier = notifier
 
         # Track processing status
         self.processing = {}  # id -> ProcessingInfo
-        self.completed = {}   # id -> ProcessingInfo
+        self.completed = OrderedDict()  # id -> ProcessingInfo, más antiguo primero
+        self._completed_max = int(getattr(config, 'COMPLETED_MAX', 500))
 
         # File mover for SMB transfers
         self.file_mover = file_mover.FileMover(config)
 
+        # Hilo dedicado a la inferencia (carga de modelos y YOLO): no compite con las
+        # tareas de E/S (ffmpeg, SMB) del executor por defecto
+        self.ml_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ml')
+        # Filtro de placas en su propio hilo, en paralelo con YOLO
+        self.plate_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plates')
+
+        # Modelos cargados una sola vez y reutilizados entre videos
+        self._model = None
+        self._model_lock = asyncio.Lock()
+        self._plate_filter = None
+        self._plate_filter_lock = asyncio.Lock()
+
+        # Encoder H.264 por hardware para el escalado (None = libx264)
+        # Se detecta en el primer recodificado (SCALE_SAVE_FHD), no al arrancar
+        self._hw_encoder = None
+        self._hw_encoder_checked = False
+
     async def add_video(self, video_path, metadata):
         """
         Encola video para procesamiento.
@@ -93,6 +191,10 @@ class VideoProcessingQueue:
             video_path: Ruta absoluta al video descargado
             metadata: Dict con información del video (title, url, format, etc.)
         """
+        if self._stopping:
+            log.warning(f"[QUEUE] Cola cerrada, video no encolado: {metadata.get('title', video_path)}")
+            return
+
         # Create processing info
         info = ProcessingInfo(
             id=metadata.get('url', video_path),
@@ -111,9 +213,8 @@ class VideoProcessingQueue:
         if self.notifier:
             await self.notifier.processing_added(info)
 
-        # Iniciar worker si no está corriendo
-        if self.worker_task is None or self.worker_task.done():
-            self.worker_task = asyncio.create_task(self._worker())
+        # Iniciar workers si no están corriendo
+        self._ensure_workers()
 
     async def _update_status(self, info: ProcessingInfo, status: str, percent: int, step: str = ''):
         """Update processing status and notify."""
@@ -123,143 +224,298 @@ class VideoProcessingQueue:
         if self.notifier:
             await self.notifier.processing_updated(info)
 
-    async def _worker(self):
-        """Worker que procesa cola secuencialmente."""
-        while True:
+    async def _get_model(self):
+        """Retorna el modelo YOLO, cargándolo en la primera llamada."""
+        async with self._model_lock:
+            if self._model is None:
+                loop = asyncio.get_event_loop()
+                self._model = await loop.run_in_executor(
+                    self.ml_executor,
+                    vehicle_extractor.load_model,
+                    self.config.YOLO_MODEL,
+                    getattr(self.config, 'YOLO_HALF', True)
+                )
+            return self._model
+
+    async def _get_plate_filter(self):
+        """Retorna el PlateFilter, creándolo en la primera llamada."""
+        async with self._plate_filter_lock:
+            if self._plate_filter is None:
+                loop = asyncio.get_event_loop()
+                self._plate_filter = await loop.run_in_executor(
+                    self.ml_executor,
+                    plate_filter_module.PlateFilter,
+                    self.config.PLATE_DETECTOR_MODEL,
+                    self.config.PLATE_OCR_MODEL,
+                    getattr(self.config, 'PLATE_PRECISION', 'fp32'),
+                    str(Path(getattr(self.config, 'STATE_DIR', '.')) / 'trt_cache')
+                )
+            return self._plate_filter
+
+    def _ensure_workers(self):
+        """Arranca (o reinicia) el worker de cada etapa que no esté corriendo."""
+        stages = (
+            ('scale', self.queue, self._scale_stage, self._extract_q),
+            ('extract', self._extract_q, self._extract_stage, self._save_q),
+            ('save', self._save_q, self._save_stage, None),
+        )
+        for name, source, stage, target in stages:
+            task = self._workers.get(name)
+            if task is None or task.done():
+                self._workers[name] = asyncio.create_task(self._stage_worker(name, source, stage, target))
+
+    async def _stage_worker(self, name: str, source: asyncio.Queue, stage, target: Optional[asyncio.Queue]):
+        """
+        Worker de una etapa del pipeline: procesa los videos de source en orden
+        y pasa a target los que deben continuar. Espera en source.get() sin
+        sondeo; close() lo cancela si está esperando y, si está procesando,
+        termina al acabar el video en curso.
+        """
+        while not self._stopping:
+            item = await source.get()
+            self._busy.add(name)
             try:
-                item = await asyncio.wait_for(self.queue.get(), timeout=1.0)
-            except asyncio.TimeoutError:
-                if self.queue.empty():
-                    break  # Salir si no hay más trabajo
-                continue
+                proceed = await stage(item)
+            except Exception as e:
+                await self._processing_failed(item, e)
+                proceed = False
+            finally:
+                self._busy.discard(name)
 
-            # LOCK: Solo 1 video se procesa a la vez
-            async with self.processing_lock:
-                await self._process_single_video(item)
+            if proceed and target is not None and not self._stopping:
+                await target.put(item)
 
-    async def _process_single_video(self, item):
+    async def close(self):
         """
-        Pipeline completo de procesamiento: escalado → extracción → filtrado → guardado → mover.
+        Detiene el pipeline al apagar.
 
-        Args:
-            item: Dict con 'path' (video), 'metadata' e 'info'
+        Los videos que una etapa está procesando terminan esa etapa; el resto
+        de la cola queda sin procesar y puede reintentarse tras reiniciar.
+        """
+        self._stopping = True
+        for name, task in self._workers.items():
+            if name not in self._busy:
+                task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+        self.ml_executor.shutdown(wait=False, cancel_futures=True)
+        self.plate_executor.shutdown(wait=False, cancel_futures=True)
+        self.file_mover.close()
+
+    async def _processing_failed(self, item, error: Exception):
+        """Marca el video como fallido y notifica."""
+        info = item["info"]
+        log.error(f"[ERROR] Fallo procesando {item['path']}: {error}", exc_info=error)
+        info.error = str(error)
+        await self._update_status(info, 'error', info.percent, str(error))
+        self._move_to_completed(info)
+        if self.notifier:
+            await self.notifier.processing_error(info)
+
+    async def _finish(self, info: ProcessingInfo, step: str):
+        """Marca el video como completado y notifica."""
+        await self._update_status(info, 'completed', 100, step)
+        self._move_to_completed(info)
+        if self.notifier:
+            await self.notifier.processing_completed(info)
+
+    async def _scale_stage(self, item) -> bool:
+        """
+        Etapa 1: verificar resolución y escalar si es necesario (0-10%).
+
+        Pipeline: escalado → extracción + filtrado → guardado + mover. Cada
+        etapa tiene su propio worker, así el escalado del siguiente video se
+        solapa con la inferencia del actual.
         """
         video_path = item["path"]
-        metadata = item["metadata"]
         info = item["info"]
-        video_name = Path(video_path).stem
 
-        log.info(f"[PROCESSING] Iniciando: {metadata['title']}")
+        log.info(f"[PROCESSING] Iniciando: {item['metadata']['title']}")
 
-        try:
-            # Directorio de salida: {download_dir}/shots/{nombreDelVideo}/
-            download_dir = metadata.get('download_dir', '.')
-            shots_dir = Path(download_dir) / 'shots' / video_name
-            shots_dir.mkdir(parents=True, exist_ok=True)
-
-            loop = asyncio.get_event_loop()
-
-            # Paso 1: Verificar resolución y escalar si es necesario (0-10%)
-            await self._update_status(info, 'scaling', 5, 'Checking video resolution')
-            processing_video = await loop.run_in_executor(
-                None,
-                self._scale_video_if_needed,
-                video_path
-            )
+        # Directorio de salida: {download_dir}/shots/{nombreDelVideo}/
+        download_dir = item["metadata"].get('download_dir', '.')
+        item["video_name"] = Path(video_path).stem
+        item["shots_dir"] = Path(download_dir) / 'shots' / item["video_name"]
 
-            if processing_video != video_path:
-                log.info(f"[SCALE] Video escalado a FHD: {processing_video}")
-            await self._update_status(info, 'scaling', 10, 'Video ready for processing')
+        loop = asyncio.get_event_loop()
 
-            # Paso 2: Extraer vehículos (10-50%)
-            await self._update_status(info, 'extracting', 15, 'Loading YOLO model')
-            crops_dict = await loop.run_in_executor(
-                None,
-                vehicle_extractor.extract_vehicles_to_dict,
-                processing_video,
-                self.config
-            )
+        # mkdir fuera del event loop: download_dir puede estar en un montaje de red
+        await loop.run_in_executor(None, partial(item["shots_dir"].mkdir, parents=True, exist_ok=True))
 
-            info.vehicles_detected = len(crops_dict)
-            log.info(f"[YOLO] {len(crops_dict)} vehículos detectados")
-            await self._update_status(info, 'extracting', 50, f'{len(crops_dict)} vehicles detected')
-
-            if len(crops_dict) == 0:
-                log.info(f"[PROCESSING] No se detectaron vehículos en {metadata['title']}")
-                await self._update_status(info, 'completed', 100, 'No vehicles detected')
-                self._move_to_completed(info)
-                if self.notifier:
-                    await self.notifier.processing_completed(info)
-                return
-
-            # Paso 3: Filtrar por placa (50-80%)
-            await self._update_status(info, 'filtering', 55, 'Initializing plate recognition')
-            plate_filter_instance = await loop.run_in_executor(
-                None,
-                plate_filter_module.PlateFilter,
-                self.config.PLATE_DETECTOR_MODEL,
-                self.config.PLATE_OCR_MODEL
-            )
+        await self._update_status(info, 'scaling', 5, 'Checking video resolution')
+        processing_video, scale = await loop.run_in_executor(
+            None,
+            self._scale_video_if_needed,
+            video_path
+        )
+
+        if processing_video != video_path:
+            log.info(f"[SCALE] Video escalado a FHD: {processing_video}")
+        item["processing_video"] = processing_video
+        item["scale"] = scale
+        await self._update_status(info, 'scaling', 10, 'Video ready for processing')
+        return True
 
-            await self._update_status(info, 'filtering', 60, 'Filtering vehicles by plate')
-            filtered_crops = await loop.run_in_executor(
-                None,
-                plate_filter_module.filter_crops_by_plate,
-                crops_dict,
+    async def _extract_stage(self, item) -> bool:
+        """Etapa 2: extraer vehículos y filtrar por placa (10-80%)."""
+        metadata = item["metadata"]
+        info = item["info"]
+        loop = asyncio.get_event_loop()
+
+        # LOCK: Solo 1 video usa la GPU a la vez
+        async with self.processing_lock:
+            await self._update_status(info, 'extracting', 15, 'Loading YOLO model')
+            model = await self._get_model()
+
+            await self._update_status(info, 'extracting', 20, 'Initializing plate recognition')
+            plate_filter_instance = await self._get_plate_filter()
+
+            await self._update_status(info, 'extracting', 25, 'Detecting vehicles and plates')
+            detected, filtered_crops = await loop.run_in_executor(
+                self.ml_executor,
+                self._extract_and_filter,
+                item["processing_video"],
+                item["scale"],
+                model,
                 plate_filter_instance
             )
 
-            info.vehicles_with_plates = len(filtered_crops)
-            log.info(f"[PLATE] {len(filtered_crops)} vehículos con placa válida")
-            await self._update_status(info, 'filtering', 80, f'{len(filtered_crops)} vehicles with valid plates')
+        info.vehicles_detected = detected
+        log.info(f"[YOLO] {detected} vehículos detectados")
+        if detected == 0:
+            log.info(f"[PROCESSING] No se detectaron vehículos en {metadata['title']}")
+            await self._finish(info, 'No vehicles detected')
+            return False
 
-            # Paso 4: Guardar imágenes (80-90%)
-            await self._update_status(info, 'saving', 85, 'Saving vehicle images')
-            saved = 0
-            for track_id, data in filtered_crops.items():
-                filename = f"{video_name}_{data['class']}_id{track_id}_conf{data['conf']:.2f}.jpg"
-                filepath = shots_dir / filename
-                cv2.imwrite(str(filepath), data['image'])
-                saved += 1
+        info.vehicles_with_plates = len(filtered_crops)
+        log.info(f"[PLATE] {len(filtered_crops)} vehículos con placa válida")
+        await self._update_status(info, 'filtering', 80, f'{len(filtered_crops)} vehicles with valid plates')
 
-            info.shots_saved = saved
-            log.info(f"[SAVED] {saved} imágenes guardadas en {shots_dir}")
-            await self._update_status(info, 'saving', 90, f'{saved} images saved')
-
-            # Paso 5: Mover a SMB si está habilitado (90-100%)
-            if self.file_mover.is_enabled():
-                await self._update_status(info, 'moving', 95, 'Moving files to network share')
-                move_result = await loop.run_in_executor(
-                    None,
-                    self.file_mover.move_to_smb,
-                    video_path,
-                    str(shots_dir),
-                    metadata['title']
-                )
-                if move_result['status'] == 'success':
-                    log.info(f"[SMB] Files moved to: {move_result['destination']}")
-                else:
-                    log.warning(f"[SMB] Move failed: {move_result.get('msg', 'Unknown error')}")
+        item["filtered_crops"] = filtered_crops
+        return True
+
+    def _extract_and_filter(self, video_path: str, scale: float, model, plate_filter) -> tuple[int, dict]:
+        """
+        Extrae vehículos y los filtra por placa en streaming.
 
-            # Completado
-            await self._update_status(info, 'completed', 100, f'{saved} images saved')
-            self._move_to_completed(info)
-            if self.notifier:
-                await self.notifier.processing_completed(info)
+        Cada lote de tracks terminados pasa al filtro de placas en plate_executor
+        mientras YOLO sigue con el video. De los vehículos sin placa solo se
+        conserva el histograma, necesario para deduplicar al final; el
+        resultado es el mismo que deduplicar primero y filtrar después.
 
-        except Exception as e:
-            log.error(f"[ERROR] Fallo procesando {video_path}: {e}", exc_info=True)
-            info.error = str(e)
-            await self._update_status(info, 'error', info.percent, str(e))
-            self._move_to_completed(info)
-            if self.notifier:
-                await self.notifier.processing_error(info)
+        Returns:
+            (vehículos únicos detectados, {track_id: datos} con placa válida)
+        """
+        def check(batch):
+            images = [data["image"] for _, data in batch]
+            results = plate_filter.has_plates_batch(images, [data["class"] for _, data in batch])
+            kept = {track_id: data for (track_id, data), (ok, _) in zip(batch, results) if ok}
+            return vehicle_extractor.compute_histograms_batch(images), kept
+
+        entries = []
+        futures = []
+        batch = []
+        tracks = vehicle_extractor.extract_vehicles_iter(video_path, self.config, model=model, scale=scale)
+        for track_id, data in tracks:
+            entries.append({"track_id": track_id, "class": data["class"], "area": data["area"]})
+            batch.append((track_id, data))
+            if len(batch) == plate_filter_module.BATCH_SIZE:
+                futures.append(self.plate_executor.submit(check, batch))
+                batch = []
+        if batch:
+            futures.append(self.plate_executor.submit(check, batch))
+
+        hists = []
+        with_plate = {}
+        for future in futures:
+            batch_hists, kept = future.result()
+            hists.append(batch_hists)
+            with_plate.update(kept)
+
+        if not entries:
+            return 0, {}
+
+        similarity_threshold = float(self.config.YOLO_SIMILARITY_THRESHOLD)
+        unique = vehicle_extractor.select_unique(entries, hists, similarity_threshold)
+        return len(unique), {t: with_plate[t] for t in unique if t in with_plate}
+
+    async def _save_stage(self, item) -> bool:
+        """Etapa 3: guardar imágenes (80-90%) y mover a SMB (90-100%)."""
+        video_path = item["path"]
+        metadata = item["metadata"]
+        info = item["info"]
+        shots_dir = item["shots_dir"]
+        filtered_crops = item.pop("filtered_crops")
+        video_name = item["video_name"]
+        loop = asyncio.get_event_loop()
+
+        # Guardar imágenes (80-90%)
+        # Con SMB habilitado los JPEG se suben desde memoria sin pasar por disco
+        upload_from_memory = self.file_mover.is_enabled()
+        await self._update_status(info, 'saving', 85, 'Saving vehicle images')
+        filenames = [
+            f"{video_name}_{data['class']}_id{track_id}_conf{data['conf']:.2f}.jpg"
+            for track_id, data in filtered_crops.items()
+        ]
+        images = [data['image'] for data in filtered_crops.values()]
+
+        # libjpeg-turbo libera el GIL al codificar: las imágenes se codifican en paralelo
+        shots = {}
+        if upload_from_memory:
+            encoded = await asyncio.gather(*(
+                loop.run_in_executor(None, _encode_jpeg, image) for image in images
+            ))
+            shots = {name: buf for name, buf in zip(filenames, encoded) if buf is not None}
+            saved = len(shots)
+        else:
+            written = await asyncio.gather(*(
+                loop.run_in_executor(None, _write_jpeg, shots_dir / name, image)
+                for name, image in zip(filenames, images)
+            ))
+            saved = sum(written)
+        if saved < len(filenames):
+            log.warning(f"[SAVED] {len(filenames) - saved} imágenes no se pudieron codificar")
+
+        info.shots_saved = saved
+        if upload_from_memory:
+            log.info(f"[SAVED] {saved} imágenes codificadas en memoria")
+        else:
+            log.info(f"[SAVED] {saved} imágenes guardadas en {shots_dir}")
+        await self._update_status(info, 'saving', 90, f'{saved} images saved')
+
+        # Mover a SMB si está habilitado
+        if upload_from_memory:
+            await self._update_status(info, 'moving', 95, 'Moving files to network share')
+            move_result = await self.file_mover.move_to_smb_async(
+                video_path,
+                str(shots_dir),
+                metadata['title'],
+                shots
+            )
+            if move_result['status'] == 'success':
+                log.info(f"[SMB] Files moved to: {move_result['destination']}")
+            else:
+                log.warning(f"[SMB] Move failed: {move_result.get('msg', 'Unknown error')}")
+                # Conservar las imágenes localmente si no se pudieron subir
+                await asyncio.gather(*(
+                    loop.run_in_executor(None, vehicle_extractor.write_file, shots_dir / filename, data)
+                    for filename, data in shots.items()
+                ))
+                log.info(f"[SAVED] {len(shots)} imágenes guardadas en {shots_dir}")
+
+        # Completado
+        await self._finish(info, f'{saved} images saved')
+        return True
 
     def _move_to_completed(self, info: ProcessingInfo):
         """Move processing info from processing to completed dict."""
         if info.id in self.processing:
             del self.processing[info.id]
         self.completed[info.id] = info
+        self.completed.move_to_end(info.id)
+        # Descartar los trabajos completados más antiguos
+        while len(self.completed) > self._completed_max:
+            self.completed.popitem(last=False)
 
     async def retry_processing(self, id: str) -> dict:
         """
@@ -299,64 +555,111 @@ class VideoProcessingQueue:
             'completed': [info.to_dict() for info in self.completed.values()]
         }
 
-    def _scale_video_if_needed(self, video_path: str) -> str:
+    @staticmethod
+    def _detect_hw_encoder() -> Optional[str]:
+        """Consulta si ffmpeg dispone del encoder NVENC."""
+        try:
+            result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], stdin=subprocess.DEVNULL,
+                                    capture_output=True, text=True, check=True)
+        except Exception as e:
+            log.warning(f"[SCALE] No se pudo consultar encoders de ffmpeg: {e}")
+            return None
+
+        if 'h264_nvenc' in result.stdout:
+            log.info("[SCALE] Encoder por hardware disponible: h264_nvenc")
+            return 'h264_nvenc'
+        return None
+
+    @staticmethod
+    def _run_ffmpeg(cmd: list):
+        """Ejecuta ffmpeg sin stdin, descartando stdout y capturando solo los errores."""
+        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def _scale_video_if_needed(self, video_path: str) -> tuple[str, float]:
         """
-        Verifica resolución del video y escala a 1920x1080 si es mayor.
+        Verifica resolución del video y decide cómo llevarlo a 1920x1080 si es mayor.
+
+        Por defecto no se recodifica: se devuelve el factor de escala para que
+        el extractor reduzca los frames al decodificarlos. Solo con
+        SCALE_SAVE_FHD se genera una copia {video}_FHD en disco.
 
         Args:
             video_path: Ruta al video original
 
         Returns:
-            str: Path al video a procesar (original o escalado)
+            tuple: (path al video a procesar, factor de escala para el extractor)
         """
-        # Obtener resolución del video con ffprobe
-        cmd = [
-            'ffprobe', '-v', 'error',
-            '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height',
-            '-of', 'csv=p=0',
-            video_path
-        ]
-
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            width, height = map(int, result.stdout.strip().split(','))
+            width, height = _probe_resolution(video_path)
 
             log.info(f"[SCALE] Resolución detectada: {width}x{height}")
 
             # Si es menor o igual a 1920x1080, usar original
             if width <= 1920 and height <= 1080:
                 log.info(f"[SCALE] Video ya está en FHD o menor, no se escala")
-                return video_path
+                return video_path, 1.0
+
+            if not getattr(self.config, 'SCALE_SAVE_FHD', False):
+                scale = min(1920 / width, 1080 / height)
+                log.info(f"[SCALE] Escalando frames al decodificar: {width}x{height} → "
+                         f"{round(width * scale)}x{round(height * scale)}")
+                return video_path, scale
 
             # Escalar a 1920x1080
-            video_dir = Path(video_path).parent
-            video_stem = Path(video_path).stem
-            video_ext = Path(video_path).suffix
-            fhd_path = video_dir / f"{video_stem}_FHD{video_ext}"
+            source = Path(video_path)
+            fhd_path = source.with_name(f"{source.stem}_FHD{source.suffix}")
 
             log.info(f"[SCALE] Escalando {width}x{height} → 1920x1080")
 
             # ffmpeg: escalar manteniendo aspect ratio, max 1920x1080
             scale_cmd = [
-                'ffmpeg', '-i', video_path,
+                'ffmpeg', '-nostdin', '-loglevel', 'error',
+                '-i', video_path,
                 '-vf', 'scale=1920:1080:force_original_aspect_ratio=decrease',
                 '-c:v', 'libx264',  # Codec H.264
-                '-preset', 'fast',   # Balance velocidad/calidad
+                '-preset', getattr(self.config, 'SCALE_PRESET', 'veryfast'),
+                '-tune', 'fastdecode',  # Más barato de decodificar para YOLO
                 '-crf', '23',        # Calidad constante
                 '-c:a', 'copy',      # Copiar audio sin recodificar
                 '-y',                # Sobrescribir si existe
                 str(fhd_path)
             ]
 
-            subprocess.run(scale_cmd, check=True, capture_output=True)
+            if not self._hw_encoder_checked:
+                self._hw_encoder = self._detect_hw_encoder()
+                self._hw_encoder_checked = True
+
+            if self._hw_encoder == 'h264_nvenc':
+                # Decodificar, escalar y codificar en GPU sin copiar frames a CPU
+                nvenc_cmd = [
+                    'ffmpeg', '-nostdin', '-loglevel', 'error',
+                    '-hwaccel', 'cuda',
+                    '-hwaccel_output_format', 'cuda',
+                    '-i', video_path,
+                    '-vf', 'scale_cuda=1920:1080:force_original_aspect_ratio=decrease',
+                    '-c:v', 'h264_nvenc',
+                    '-preset', 'p4',
+                    '-cq', '23',
+                    '-c:a', 'copy',
+                    '-y',
+                    str(fhd_path)
+                ]
+                try:
+                    self._run_ffmpeg(nvenc_cmd)
+                    log.info(f"[SCALE] Video escalado guardado (NVENC): {fhd_path}")
+                    return str(fhd_path), 1.0
+                except subprocess.CalledProcessError as e:
+                    log.warning(f"[SCALE] NVENC falló, usando libx264: {e.stderr}")
+
+            self._run_ffmpeg(scale_cmd)
 
             log.info(f"[SCALE] Video escalado guardado: {fhd_path}")
-            return str(fhd_path)
+            return str(fhd_path), 1.0
 
         except subprocess.CalledProcessError as e:
             log.error(f"[SCALE] Error escalando video: {e.stderr}")
-            return video_path  # Usar original si falla
+            return video_path, 1.0  # Usar original si falla
         except Exception as e:
             log.error(f"[SCALE] Error inesperado: {e}")
-            return video_path
+            return video_path, 1.0